@@ -28,6 +28,9 @@ def main():
         "-so", "--save-as-owl", action="store_true",
         help="output the ontology in OWL format"
     )
+    populate_parser.add_argument(
+        "-p", "--processes", type=int, default=0,
+        help="number of parsing processes (0 for as many as CPUs)")
     args = parser.parse_args()
     log_level = logging.INFO
     if args.verbose:
@@ -43,9 +46,14 @@ def main():
         max_iters = None
         if args.max_iter > 0:
             max_iters = args.max_iter
+        processes = None
+        if args.processes > 0:
+            processes = args.processes
         populate.populate_individuals(
             args.database, args.resources, args.output,
-            max_iters=max_iters, save_as_owl=args.save_as_owl)
+            max_iters=max_iters, save_as_owl=args.save_as_owl,
+            processes=processes)
 
 
-main()
+if __name__ == "__main__":
+    main()
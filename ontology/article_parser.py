@@ -3,13 +3,15 @@ for its integration in the ontology.
 """
 
 import re
+import sys
 import logging
-import wikitextparser
+import operator
+import functools
+import wikitext_parser
 
 
-SECTION_TITLE_PATTERN = re.compile(r"=|{|}")
-DEFINITION_PATTERN = re.compile(r"^ *(#+) *(\*?) *(.*)")
-MULTIPLE_SPACES_PATTERN = re.compile("  +")
+SECTION_TITLE_DELETIONS = str.maketrans("", "", "={}")
+DEFINITION_PATTERN = re.compile(r"^ *(#+) *(\*?) *(.*)", re.MULTILINE)
 TEMPLATE_PATTERN = re.compile(r"{{(.*?)}}")
 VERBAL_INFLECTION_PATTERN = re.compile(
     r"^ *(première|deuxième|troisième) personne du (singulier|pluriel) d[ue’'](?: l[’'])? ?(.*?) (?:d[e’']|du verbe)",  # pylint: disable=C0301
@@ -53,6 +55,26 @@ AGREEMENT_INFLECTION_PATTERNS = {
             + INFLECTION_LINK_REGEX)
     ]
 }
+
+
+def _join_patterns(patterns):
+    """Compile a single pattern matching wherever one of the patterns does.
+    """
+    return re.compile("|".join(
+        "(?:%s)" % pattern
+        for pattern in dict.fromkeys(pattern.pattern for pattern in patterns)
+    ))
+
+
+AGREEMENT_INFLECTION_ANY_PATTERN = _join_patterns(
+    pattern
+    for patterns in AGREEMENT_INFLECTION_PATTERNS.values()
+    for pattern in patterns
+)
+AGREEMENT_INFLECTION_JOINED_PATTERNS = {
+    inflection: _join_patterns(patterns)
+    for inflection, patterns in AGREEMENT_INFLECTION_PATTERNS.items()
+}
 VERBAL_INFLECTION_PATTERN = re.compile(
     r"(première|deuxième|troisième) personne du (singulier|pluriel) d[ue’'](?: l[’'])? ?(.*?) (?:d[e’']|du verbe)",  # pylint: disable=C0301
     re.IGNORECASE
@@ -112,7 +134,16 @@ PARTICIPLE_MAPPING = {
     " masculin (singulier ou pluriel)": ["pastParticipleMS", "pastParticipleMP"]
 }
 
+TRAIT_TEMPLATES = {
+    "m": [("hasGender", "masculine")],
+    "f": [("hasGender", "feminine")],
+    "mf": [("hasGender", "masculine"), ("hasGender", "feminine")],
+    "p": [("hasNumber", "plural")],
+    "s": [("hasNumber", "singular")],
+}
+
 
+@functools.lru_cache(maxsize=200000)
 def format_literal(raw):
     """Format a literal into a safe format. This is used to format the
     flont:Literal IRI.
@@ -124,13 +155,19 @@ def parse_section_title(section):
     """Extract and lemmatize the category of a section title. Notice: returned
     string is always lowercase and stripped.
     """
-    parsed = SECTION_TITLE_PATTERN.sub("", section.title).lower()
+    return lemmatize_section_title(section.title)
+
+
+@functools.lru_cache(maxsize=4096)
+def lemmatize_section_title(title):
+    """Cached implementation of `parse_section_title`, from the raw title.
+    Returned strings are interned, as they are used for many lookups.
+    """
+    parsed = title.translate(SECTION_TITLE_DELETIONS).lower()
     split = parsed.split("|")
-    if len(split) == 1:
-        return split[0].strip()
-    if split[0].strip() == "s":
-        return split[1].strip()
-    return split[0].strip()
+    if len(split) > 1 and split[0].strip() == "s":
+        return sys.intern(split[1].strip())
+    return sys.intern(split[0].strip())
 
 
 def extract_pronunciation(section):
@@ -146,58 +183,111 @@ def extract_pronunciation(section):
     return None
 
 
+@functools.lru_cache(maxsize=None)
+def _slot_names(cls):
+    """Names of all the slots of a class, including inherited ones.
+    """
+    return tuple(
+        name
+        for klass in cls.__mro__
+        for name in getattr(klass, "__slots__", ())
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _slot_getter(cls):
+    """Getter returning the tuple of all the slot values of an instance.
+    """
+    return operator.attrgetter(*_slot_names(cls))
+
+
 class OntologyIndividual:
     """Python representation of an individual in the ontology.
     """
 
+    __slots__ = (
+        "rscmgr",
+        "cls",
+        "iri",
+        "_data_ppties",
+        "_data_values",
+        "_object_ppties",
+        "_object_values",
+        "_reversed_object_ppties",
+        "_reversed_object_values",
+    )
+
     def __init__(self, rscmgr, cls=None):
         self.rscmgr = rscmgr
         self.cls = cls
         self.iri = None
-        self._data_properties = set()
-        self._object_properties = set()
-        self._reversed_object_properties = set()
+        # Properties are stored as parallel lists of names and values, which
+        # is lighter than sets of tuples. Duplicates are removed by getters.
+        self._data_ppties = list()
+        self._data_values = list()
+        self._object_ppties = list()
+        self._object_values = list()
+        self._reversed_object_ppties = list()
+        self._reversed_object_values = list()
+
+    def __getstate__(self):
+        # The resource manager is shared by all individuals and is not needed
+        # once they are parsed, so it is not sent along with them between
+        # processes. The state is the list of the slot values, which is
+        # lighter to send than a dict of them.
+        names = _slot_names(type(self))
+        state = list(_slot_getter(type(self))(self))
+        state[names.index("rscmgr")] = None
+        return state
+
+    def __setstate__(self, state):
+        for name, value in zip(_slot_names(type(self)), state):
+            setattr(self, name, value)
 
     def get_data_properties(self):
         """Getter for the data properties.
         """
-        return self._data_properties
+        return dict.fromkeys(zip(self._data_ppties, self._data_values))
 
     def get_object_properties(self):
         """Getter for the object properties.
         """
-        return self._object_properties
+        return dict.fromkeys(zip(self._object_ppties, self._object_values))
 
     def get_reversed_object_properties(self):
         """Getter for the reversed object properties.
         """
-        return self._reversed_object_properties
+        return dict.fromkeys(zip(self._reversed_object_ppties, self._reversed_object_values))
 
     def add_data_property(self, ppty, value):
         """Add a data property to the individual. The value will be inserted
         as passed in the ontology.
         """
-        self._data_properties.add((ppty, value))
+        self._data_ppties.append(ppty)
+        self._data_values.append(value)
 
     def add_object_property(self, ppty, value):
         """Add an object property to the individual. The value is a local IRI
         (i.e. without prefix) to another object.
         """
-        self._object_properties.add((ppty, value))
+        self._object_ppties.append(ppty)
+        self._object_values.append(value)
 
     def add_reversed_object_property(self, ppty, value):
         """Add an object property to the individual where the individual is
         the object of the triple.
         """
-        self._reversed_object_properties.add((ppty, value))
+        self._reversed_object_ppties.append(ppty)
+        self._reversed_object_values.append(value)
 
     def _parse_links(self, ppty, section):
         """Parse wikilinks from a wikitext section and add them as object for
         an object property. The wikilink target is expected to be a literal's
         label, that is converted into the literal IRI.
         """
-        for link in section.wikilinks:
-            self.add_object_property(ppty, format_literal(link.target))
+        values = [format_literal(link.target) for link in section.wikilinks]
+        self._object_ppties.extend([ppty] * len(values))
+        self._object_values.extend(values)
 
 
 class SectionParser:
@@ -206,12 +296,15 @@ class SectionParser:
     `_parse_subsection` methods.
     """
 
-    IGNORE = set()
-    SELECT = None
+    __slots__ = ()
 
-    def __init__(self, top_level, sub_level):
-        self._top_level = top_level
-        self._sub_level = sub_level
+    # Parsing levels are constant for each subclass, hence class attributes.
+    TOP_LEVEL = None
+    SUB_LEVEL = None
+    IGNORE = frozenset()
+    SELECT = None
+    # Matches the start of title lines mentioning the selected title.
+    SELECT_PATTERN = None
 
     def _parse_head(self, title, head):
         raise NotImplementedError()
@@ -219,38 +312,75 @@ class SectionParser:
     def _parse_subsection(self, subtitle, subsection):
         raise NotImplementedError()
 
-    def parse_section(self, section):
+    def parse_section(self, section, title=None):
         """Parse a top level section: first its head (piece of text below the
         section title and above the first subsection), and then all of its
-        non-ignored subsections.
+        non-ignored subsections. The parsed section title may be passed if
+        already known.
         """
-        title = parse_section_title(section)
-        head = section.get_sections(
-            level=self._top_level,
-            include_subsections=False
-        )
-        if len(head) > 0:
-            self._parse_head(title, head[0])
-        for subsection in section.get_sections(level=self._sub_level):
+        if section.level == self.TOP_LEVEL:
+            if title is None:
+                title = parse_section_title(section)
+            # The head is the section itself, up to its first subsection.
+            self._parse_head(title, section.head)
+        for subsection in section.get_sections(level=self.SUB_LEVEL):
             subtitle = parse_section_title(subsection)
             if subtitle not in self.IGNORE:
                 if not self._parse_subsection(subtitle, subsection):
                     logging.warning(
                         "Could not parse level %d section entitled '%s'",
-                        self._sub_level,
+                        self.SUB_LEVEL,
                         subsection.title
                     )
 
+    def _locate_selected_section(self, wikitext):
+        """Return the `(start, end)` slice of the selected section, found
+        without parsing. Bounds that can not be checked to match the ones the
+        parser would find are left open: the first title line mentioning the
+        selected title must be exactly the selected one, nothing before a
+        bound may be ignored by the parser, and no template or wikilink may
+        cross a bound (title lines within them are not headings).
+        """
+        match = self.SELECT_PATTERN.search(wikitext)
+        if match is None:
+            return 0, None
+        start = match.start()
+        match = wikitext_parser.HEADING_PATTERN.match(wikitext, start)
+        if match is None\
+                or len(match.group(1)) != self.TOP_LEVEL\
+                or match.group(2).strip() != self.SELECT\
+                or wikitext_parser.may_ignore(wikitext, 0, match.end())\
+                or not wikitext_parser.is_balanced(wikitext, 0, start):
+            return 0, None
+        for heading in wikitext_parser.HEADING_PATTERN.finditer(wikitext, match.end()):
+            if len(heading.group(1)) <= self.TOP_LEVEL:
+                if wikitext_parser.may_ignore(wikitext, start, heading.end())\
+                        or not wikitext_parser.is_balanced(wikitext, start, heading.start()):
+                    break
+                return start, heading.start()
+        return start, None
+
     def parse_wikitext(self, wikitext):
         """Parse a string with wikitext markup. Check all top level sections
         until the selected one is found, and parse it.
         """
-        parsed = wikitextparser.parse(wikitext)
-        for section in parsed.get_sections(level=self._top_level):
+        if self.SELECT not in wikitext:
+            return
+        # Only feed the parser with the selected section, when its title can
+        # be located without parsing.
+        start, end = self._locate_selected_section(wikitext)
+        wikitext = wikitext[start:end]
+        # Nothing is parsed out of the section title itself, so there is no
+        # need to parse a text without any subsection title.
+        sub_level_prefix = "=" * self.SUB_LEVEL
+        if not wikitext.startswith(sub_level_prefix)\
+                and "\n" + sub_level_prefix not in wikitext:
+            return
+        parsed = wikitext_parser.parse(wikitext)
+        for section in parsed.get_sections(level=self.TOP_LEVEL):
             if section.title is not None\
                     and section.title.strip() == self.SELECT:
-                for subsection in section.get_sections(level=self._sub_level):
-                    self.parse_section(subsection)
+                self.parse_section(section)
                 break
 
 
@@ -258,9 +388,14 @@ class WikitextLiteral(SectionParser, OntologyIndividual):
     """Python representation of a flont:Literal.
     """
 
+    __slots__ = ("entries", "pronunciation")
+
+    TOP_LEVEL = 2
+    SUB_LEVEL = 3
     SELECT = "{{langue|fr}}"
+    SELECT_PATTERN = re.compile(r"^=+[^\S\n]*" + re.escape(SELECT), re.MULTILINE)
 
-    IGNORE = {
+    IGNORE = frozenset({
         "références",
         "réf",
         "voir aussi",
@@ -277,10 +412,16 @@ class WikitextLiteral(SectionParser, OntologyIndividual):
         "homophone",
         "paronymes",
         "quasi-synonymes"
+    })
+
+    SUBSECTION_METHODS = {
+        "étymologie": "_parse_etymology",
+        "anagrammes": "_parse_anagrams",
+        "prononciation": "_parse_pronunciation",
+        "pron": "_parse_pronunciation",
     }
 
     def __init__(self, rscmgr):
-        SectionParser.__init__(self, 2, 3)
         OntologyIndividual.__init__(self, rscmgr, "Literal")
         self.entries = list()
         self.pronunciation = None
@@ -289,25 +430,25 @@ class WikitextLiteral(SectionParser, OntologyIndividual):
         pass
 
     def _parse_subsection(self, subtitle, subsection):
-        if subtitle == "étymologie":
-            self._parse_etymology(subsection)
-        elif subtitle == "anagrammes":
-            self._parse_links("hasAnagram", subsection)
-        elif subtitle in {"prononciation", "pron"}:
-            self._parse_pronunciation(subsection)
+        method = self.SUBSECTION_METHODS.get(subtitle)
+        if method is not None:
+            getattr(self, method)(subsection)
         elif subtitle in self.rscmgr.pos_templates:
             self._parse_lexical_entry(subtitle, subsection)
         else:
             return False
         return True
 
-    def _parse_lexical_entry(self, _, subsection):
-        entry = WikitextEntry.from_section(self, subsection)
+    def _parse_lexical_entry(self, subtitle, subsection):
+        entry = WikitextEntry.from_section(self, subsection, subtitle)
         self.entries.append(entry)
 
     def _parse_etymology(self, section):
         self.add_data_property("etymology", section.contents.strip())
 
+    def _parse_anagrams(self, section):
+        self._parse_links("hasAnagram", section)
+
     def _parse_pronunciation(self, section):
         self.pronunciation = extract_pronunciation(section)
 
@@ -324,9 +465,9 @@ class WikitextLiteral(SectionParser, OntologyIndividual):
         literal = cls(rscmgr)
         literal.set_iri(article_title)
         literal.parse_wikitext(article_content)
-        for entry in literal.entries:
+        for i, entry in enumerate(literal.entries):
             entry.check_for_pronunciation()
-            entry.set_iri()
+            entry.set_iri(i)
         return literal
 
 
@@ -334,7 +475,16 @@ class WikitextEntry(SectionParser, OntologyIndividual):
     """Python representation of a flont:LexicalEntry.
     """
 
-    IGNORE = {
+    __slots__ = (
+        "literal",
+        "senses",
+        "_known_pronunciation",
+    )
+
+    TOP_LEVEL = 3
+    SUB_LEVEL = 4
+
+    IGNORE = frozenset({
         "notes",
         "transcriptions",
         "dérivés autres langues",
@@ -351,39 +501,34 @@ class WikitextEntry(SectionParser, OntologyIndividual):
         "références",
         "liens externes",
         "anagrammes",
-    }
+    })
 
     def __init__(self, literal):
-        SectionParser.__init__(self, 3, 4)
         OntologyIndividual.__init__(self, literal.rscmgr, "LexicalEntry")
         self.literal = literal
         self.senses = list()
         self._known_pronunciation = False
 
-    def set_iri(self):
+    def set_iri(self, i):
         """Set the entry IRI and link it to its literal. The literal IRI must
-        have been set before!
+        have been set before! `i` is the index of the entry in the literal
+        entries.
         """
-        nth_of_type = 1
-        for other in self.literal.entries:
-            if self == other:
-                break
-            nth_of_type += 1
         self.iri = "%s_%s%d" % (
             self.literal.iri,
             self.rscmgr.pos_abbreviations[self.cls],
-            nth_of_type
+            i + 1
         )
         self.literal.add_object_property("isLiteralOf", self.iri)
-        for i, sense in enumerate(self.senses):
-            sense.set_iri(i)
+        for j, sense in enumerate(self.senses):
+            sense.set_iri(j)
 
     @classmethod
-    def from_section(cls, literal, section):
+    def from_section(cls, literal, section, title=None):
         """Create an entry from a entry section.
         """
         entry = cls(literal)
-        entry.parse_section(section)
+        entry.parse_section(section, title)
         return entry
 
     def check_for_pronunciation(self):
@@ -414,25 +559,19 @@ class WikitextEntry(SectionParser, OntologyIndividual):
 
     def _parse_traits(self, section):
         for template in section.templates:
-            if template.name == "m":
-                self.add_object_property("hasGender", "masculine")
-            elif template.name == "f":
-                self.add_object_property("hasGender", "feminine")
-            elif template.name == "mf":
-                self.add_object_property("hasGender", "masculine")
-                self.add_object_property("hasGender", "feminine")
-            elif template.name == "p":
-                self.add_object_property("hasNumber", "plural")
-            elif template.name == "s":
-                self.add_object_property("hasNumber", "singular")
+            traits = TRAIT_TEMPLATES.get(template.name)
+            if traits is None:
+                continue
+            for ppty, value in traits:
+                self.add_object_property(ppty, value)
 
     def _parse_head_verbal_inflections(self, head):
-        templates = {
-            t.name: t.arguments
-            for t in head.templates
-        }
-        verb_template = templates.get("fr-verbe-flexion")
-        if verb_template is None:
+        # Only the last inflection template is considered.
+        for template in reversed(head.templates):
+            if template.name == "fr-verbe-flexion":
+                verb_template = template.arguments
+                break
+        else:
             return
         literal = None
         inflections = set()
@@ -459,8 +598,7 @@ class WikitextEntry(SectionParser, OntologyIndividual):
                 if match.group(1) == "présent":
                     ppties.add("presentParticiple")
                 elif match.group(2) in PARTICIPLE_MAPPING:
-                    for ppty in PARTICIPLE_MAPPING[match.group(2)]:
-                        ppties.add(ppty)
+                    ppties.update(PARTICIPLE_MAPPING[match.group(2)])
             else:
                 tense_raw = match.group(3).lower().strip()
                 tense = TENSE_MAPPING.get(tense_raw)
@@ -472,32 +610,33 @@ class WikitextEntry(SectionParser, OntologyIndividual):
                     + NUMBER_MAPPING[match.group(2).lower()]
                 )
             if len(ppties) > 0:
-                parsed = wikitextparser.parse(sense.definition[match.end():])
-                for link in parsed.wikilinks:
-                    tgt = format_literal(link.target.split("#")[0])
-                    for ppty in ppties:
-                        self.add_reversed_object_property(ppty, tgt)
+                # The article is already parsed, but the definition was
+                # rewritten since, so only its tail is parsed again, and only
+                # if it may hold a wikilink.
+                tail = sense.definition[match.end():]
+                if "[[" in tail:
+                    for link in wikitext_parser.parse(tail).wikilinks:
+                        tgt = format_literal(link.target.split("#")[0])
+                        for ppty in ppties:
+                            self.add_reversed_object_property(ppty, tgt)
                 self.senses.remove(sense)
 
     def _parse_senses(self, head):
         senses = list()
         definition, examples = None, list()
-        for line in head.contents.split("\n"):
-            match = DEFINITION_PATTERN.search(line)
-            if match is None:
-                continue
+        for match in DEFINITION_PATTERN.finditer(head.contents):
             if len(match.group(1)) > 1:
                 # Here the definition is a sub definition, outside of our focus.
                 continue
             if match.group(2) == "":
                 if definition is not None:
-                    senses.append((definition, examples[:]))
+                    senses.append((definition, examples))
                     examples = list()
                 definition = match.group(3)
             else:
                 examples.append(match.group(3))
         if definition is not None:
-            senses.append((definition, examples[:]))
+            senses.append((definition, examples))
         for definition, examples in senses:
             sense = WikitextSense.from_definition(self, definition, examples)
             if sense.has_dependency and len(self.senses) > 0:
@@ -506,8 +645,17 @@ class WikitextEntry(SectionParser, OntologyIndividual):
 
     def _parse_sense_inflections(self):
         for sense in self.senses[:]:
+            # Most definitions are not inflections: reject them with a single
+            # scan before trying each pattern separately.
+            if AGREEMENT_INFLECTION_ANY_PATTERN.search(sense.definition) is None:
+                continue
             is_inflection = False
             for inflection, patterns in AGREEMENT_INFLECTION_PATTERNS.items():
+                # Each pattern is only tried if one of the inflection's does
+                # match, which is checked with a single scan.
+                joined = AGREEMENT_INFLECTION_JOINED_PATTERNS[inflection]
+                if joined.search(sense.definition) is None:
+                    continue
                 for pattern in patterns:
                     match = pattern.search(sense.definition)
                     if match is not None:
@@ -539,6 +687,8 @@ class WikitextSense(OntologyIndividual):
     """Python representation of a flont:LexicalSense.
     """
 
+    __slots__ = ("entry", "definition", "has_dependency", "depends_on")
+
     def __init__(self, entry):
         OntologyIndividual.__init__(self, entry.rscmgr, "LexicalSense")
         self.entry = entry
@@ -578,7 +728,9 @@ class WikitextSense(OntologyIndividual):
             self._parse_precisions_callback,
             definition
         )
-        definition = MULTIPLE_SPACES_PATTERN.sub(" ", definition).strip()
+        # Only collapse regular spaces: non-breaking ones are meaningful in
+        # French typography.
+        definition = " ".join(filter(None, definition.split(" "))).strip()
         self.add_data_property("definition", definition)
         self.definition = definition
         for example in examples:
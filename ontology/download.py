@@ -3,23 +3,58 @@
 
 import os
 import re
+import bz2
 import logging
+import itertools
+import threading
+import contextlib
+import collections
+import multiprocessing
+import concurrent.futures
 import sqlite3
-import xml.etree.ElementTree
+import lxml.etree
 import requests
 import clint
-import bz2file
 import tqdm
+try:
+    import indexed_bzip2
+except ImportError:
+    indexed_bzip2 = None
 
 
 NS = "{http://www.mediawiki.org/xml/export-0.10/}"
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+DOWNLOAD_CONNECTIONS = 8
+# Seconds to wait for the server to respond or to send some data, before
+# giving up on a request. Interrupted ranges are resumed a few times.
+DOWNLOAD_TIMEOUT = 60
+DOWNLOAD_RETRIES = 3
+# The database is built from scratch, so durability is not a concern while
+# it is populated. The journal is kept in memory, which also avoids leaving
+# the file in WAL mode, as it is later opened read-only.
+DB_PRAGMAS = {
+    "journal_mode": "MEMORY",
+    "synchronous": "OFF",
+    "temp_store": "MEMORY",
+    "cache_size": -262144,
+}
+INSERT_QUERY = "INSERT INTO entries (title, content) VALUES (?, ?)"
+INSERT_BATCH_SIZE = 1000
+COMMIT_SIZE = 50000
+CLEAN_BATCH_SIZE = 10000
+CLEAN_CHUNK_SIZE = 256
+CLEAN_BATCHES_SUBMITTED = 2
 
-SECTION_TITLE_PATTERN = re.compile(r"^(=+) (.*) =+$")
+# Title lines are matched with their preceding line break, as a literal
+# prefix is way faster to search for than a line start.
+SECTION_TITLE_PATTERN = re.compile(
+    r"\n[^\S\n]*(=+) (.*) =+[^\S\n]*$", re.MULTILINE)
+LANGUAGE_PATTERN = re.compile(r"{{langue\|.+}}")
 
-SECTION_BLACKLIST = {
+SECTION_BLACKLIST = frozenset({
     "{{S|traductions}}",
     "{{S|traductions à trier}}",
-}
+})
 
 
 def find_last_dump():
@@ -29,7 +64,8 @@ def find_last_dump():
     """
     logging.info("Requesting dump index...")
     response = requests.get(
-        "https://wikimedia.mirror.us.dev/backup-index.html")
+        "https://wikimedia.mirror.us.dev/backup-index.html",
+        timeout=DOWNLOAD_TIMEOUT)
     html = response.text
     match = re.search("<a href=\"frwiktionary/(.*?)\">frwiktionary</a>", html)
     if match is None:
@@ -48,7 +84,7 @@ def find_download_link(dump):
     """
     url = "https://wikimedia.mirror.us.dev/frwiktionary/%s/dumpstatus.json" % dump
     logging.info("Requesting dump status...")
-    response = requests.get(url).json()
+    response = requests.get(url, timeout=DOWNLOAD_TIMEOUT).json()
     download_link = "https://wikimedia.mirror.us.dev"\
         + response["jobs"]["articlesmultistreamdump"]["files"]\
             ["frwiktionary-%s-pages-articles-multistream.xml.bz2" % dump]["url"]
@@ -56,27 +92,122 @@ def find_download_link(dump):
     return download_link
 
 
+def _download_stream(download_link, path):
+    response = requests.get(
+        download_link, stream=True, timeout=DOWNLOAD_TIMEOUT)
+    response.raise_for_status()
+    with open(path, "wb", buffering=DOWNLOAD_CHUNK_SIZE) as output_file:
+        total_length = int(response.headers.get("content-length"))
+        for chunk in clint.textui.progress.bar(
+                response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE),
+                expected_size=(total_length / DOWNLOAD_CHUNK_SIZE) + 1):
+            if chunk:
+                output_file.write(chunk)
+
+
+def _download_range(download_link, path, first, last, pbar, stop):
+    """Download the bytes from `first` to `last` (included) of a file, and
+    write them at the same position in the local file. If the download is
+    interrupted, it is resumed up to `DOWNLOAD_RETRIES` times. It is given up
+    once the `stop` event is set. Return False if the server does not serve
+    the range.
+    """
+    position = first
+    retries = 0
+    while True:
+        try:
+            response = requests.get(
+                download_link,
+                headers={"Range": "bytes=%d-%d" % (position, last)},
+                stream=True,
+                timeout=DOWNLOAD_TIMEOUT)
+            response.raise_for_status()
+            if response.status_code != 206:
+                response.close()
+                return False
+            with open(path, "r+b", buffering=DOWNLOAD_CHUNK_SIZE) as output_file:
+                output_file.seek(position)
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    if stop.is_set():
+                        response.close()
+                        return False
+                    if position + len(chunk) > last + 1:
+                        raise IOError("Received more bytes than requested")
+                    output_file.write(chunk)
+                    position += len(chunk)
+                    pbar.update(len(chunk))
+            if position != last + 1:
+                raise IOError("Received %d bytes out of %d" % (
+                    position - first, last - first + 1))
+            return True
+        except (requests.RequestException, IOError) as error:
+            retries += 1
+            if retries > DOWNLOAD_RETRIES or stop.is_set():
+                raise
+            logging.warning(
+                "Resuming download of bytes %d-%d: %s", position, last, error)
+
+
+def _download_ranges(download_link, path, total_length):
+    """Download a file over several connections, each one fetching a range
+    of it. Return False if the server does not serve ranges. If a range can
+    not be downloaded, the other ones are given up, and the local file is
+    removed, since it would be full-size while missing some parts.
+    """
+    with open(path, "wb") as output_file:
+        output_file.truncate(total_length)
+    bounds = [
+        total_length * i // DOWNLOAD_CONNECTIONS
+        for i in range(DOWNLOAD_CONNECTIONS + 1)
+    ]
+    stop = threading.Event()
+    try:
+        with tqdm.tqdm(total=total_length, unit="B", unit_scale=True) as pbar,\
+                concurrent.futures.ThreadPoolExecutor(DOWNLOAD_CONNECTIONS) as executor:
+            futures = [
+                executor.submit(
+                    _download_range,
+                    download_link,
+                    path,
+                    first,
+                    end - 1,
+                    pbar,
+                    stop)
+                for first, end in zip(bounds[:-1], bounds[1:])
+                if end > first
+            ]
+            try:
+                served = all([future.result() for future in futures])
+            finally:
+                stop.set()
+    except BaseException:
+        os.remove(path)
+        raise
+    return served
+
+
 def download_file(download_link):
     """Step 3.
-    Download this big massive file.
+    Download this big massive file. If the server accepts range requests, the
+    file is downloaded over several connections at once.
     """
     path = os.path.realpath(download_link.split("/")[-1])
     logging.info("Downloading to %s", path)
-    response = requests.get(download_link, stream=True)
-    with open(path, "wb") as output_file:
-        total_length = int(response.headers.get("content-length"))
-        for chunk in clint.textui.progress.bar(
-                response.iter_content(chunk_size=1024),
-                expected_size=(total_length / 1024) + 1):
-            if chunk:
-                output_file.write(chunk)
-                output_file.flush()
+    response = requests.head(
+        download_link, allow_redirects=True, timeout=DOWNLOAD_TIMEOUT)
+    total_length = int(response.headers.get("content-length", 0))
+    if response.headers.get("accept-ranges") == "bytes" and total_length > 0\
+            and _download_ranges(download_link, path, total_length):
+        return path
+    logging.info("Ranges are not supported, downloading over one connection")
+    _download_stream(download_link, path)
     return path
 
 
 def create_database(dump):
     """Step 4.
-    Create the database and the main table for storing the data.
+    Create the database, the main table for storing the data and a table
+    for meta information, such as the number of entries.
     """
     filename = "%s.sqlite3" % dump
     if os.path.isfile(filename):
@@ -93,67 +224,155 @@ def create_database(dump):
         content TEXT NOT NULL
     )
     """.strip())
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value
+    )
+    """.strip())
     connection.commit()
     connection.close()
     return filename
 
 
 def clear_article_content(raw_content):
-    """Minor cleaning for article's contents for step 5.
+    """Minor cleaning for article's contents for step 5. Only section titles
+    are looked for, and the text between them is kept or dropped as a whole.
     """
-    clean_content = ""
+    content = "\n" + raw_content.strip()
+    clean_parts = list()
     active = False
     last_section_level = 10
-    for line in raw_content.strip().split("\n"):
-        match = SECTION_TITLE_PATTERN.search(line.strip())
-        if match is not None:
-            section_level = len(match.group(1))
-            section_title = match.group(2)
-            if not active and section_level > last_section_level:
-                pass
+    position = 1
+    for match in SECTION_TITLE_PATTERN.finditer(content):
+        if active:
+            clean_parts.append(content[position:match.start() + 1])
+        section_level = len(match.group(1))
+        section_title = match.group(2)
+        # Subsections of an inactive section are skipped along with it.
+        if active or section_level <= last_section_level:
+            active = section_title == "{{langue|fr}}"\
+                or (section_title not in SECTION_BLACKLIST
+                    and not LANGUAGE_PATTERN.match(section_title))
+            if active:
+                last_section_level = 10
             else:
-                active = section_title == "{{langue|fr}}"\
-                    or (section_title not in SECTION_BLACKLIST
-                        and not re.match(r"{{langue\|.+}}", section_title))
-                if active:
-                    last_section_level = 10
-                else:
-                    last_section_level = min(last_section_level, section_level)
+                last_section_level = min(last_section_level, section_level)
         if active:
-            clean_content += line + "\n"
-    return clean_content
+            clean_parts.append(content[match.start() + 1:match.end()] + "\n")
+        position = match.end() + 1
+    if active and position <= len(content):
+        clean_parts.append(content[position:] + "\n")
+    return "".join(clean_parts)
+
+
+def open_dump(dump_filename, threads=None):
+    """Open the compressed dump for reading. The dump is made of several bz2
+    streams, which are decompressed in parallel by `threads` threads (as many
+    as CPUs if None) if `indexed_bzip2` is available. The standard `bz2`
+    module is only the fallback, used when `indexed_bzip2` is not installed.
+    """
+    if indexed_bzip2 is not None:
+        return indexed_bzip2.open(
+            dump_filename, parallelization=threads or os.cpu_count())
+    return bz2.open(dump_filename, "rb")
+
+
+def iter_pages(xml_file):
+    """Iterate over the French articles of a dump, as `(title, content)`
+    tuples, where the content is raw.
+    """
+    pbar = tqdm.tqdm(unit="page")
+    parser = lxml.etree.iterparse(
+        xml_file, events=("end",), tag=NS + "page", huge_tree=True)
+    for _, element in parser:
+        pbar.update(1)
+        if element.findtext(NS + "ns") == "0":
+            content = element.findtext(NS + "revision/" + NS + "text")
+            # Most pages are not French, so their title is not even read.
+            if "== {{langue|fr}} ==" in content:
+                yield element.findtext(NS + "title"), content
+        # Processed pages are removed from the root, which would otherwise
+        # keep all of them, even empty.
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+    pbar.close()
+
+
+def _clean_article(article):
+    title, content = article
+    return title, clear_article_content(content)
+
+
+def iter_articles(xml_file, pool=None):
+    """Iterate over the French articles of a dump, as `(title, content)`
+    tuples, where the content is cleaned. If a pool of worker processes is
+    given, contents are cleaned by the workers, while pages are read by the
+    main process. Articles are yielded in the dump order.
+    """
+    pages = iter_pages(xml_file)
+    if pool is None:
+        yield from map(_clean_article, pages)
+        return
+    # Pages are submitted by batches, as the pool would otherwise read the
+    # whole dump ahead of the workers. The next batch is submitted before the
+    # results of the current one are consumed, so that workers do not wait
+    # while the main process reads pages.
+    submitted = collections.deque()
+    while True:
+        batch = list(itertools.islice(pages, CLEAN_BATCH_SIZE))
+        if batch:
+            submitted.append(pool.imap(
+                _clean_article, batch, chunksize=CLEAN_CHUNK_SIZE))
+        elif not submitted:
+            break
+        if not batch or len(submitted) >= CLEAN_BATCHES_SUBMITTED:
+            yield from submitted.popleft()
 
 
-def populate_database(database_filename, dump_filename):
+def populate_database(database_filename, dump_filename, processes=1):
     """Step 5.
-    Read and parse the downloaded file, and every time an article is
-    encountered, we insert it in the database.
+    Read and parse the downloaded file, and insert its articles in the
+    database, by batches. Articles are cleaned by `processes` processes (as
+    many as CPUs if None). A single process is the default, as cleaning is
+    cheap compared to reading the dump: it does not make up for sending the
+    articles to worker processes and back.
     """
     logging.info("Populating database (there are ca. 4M pages)...")
-    connection = sqlite3.connect(database_filename)
+    # Transactions are explicitly managed.
+    connection = sqlite3.connect(database_filename, isolation_level=None)
+    for pragma, value in DB_PRAGMAS.items():
+        connection.execute("PRAGMA %s = %s" % (pragma, value))
     cursor = connection.cursor()
-    with bz2file.BZ2File(dump_filename) as xml_file:
-        parser = xml.etree.ElementTree.iterparse(xml_file)
-        pbar = tqdm.tqdm(unit="page")
-        for event, element in parser:
-            if event == "end" and element.tag == NS + "page":
-                pbar.update(1)
-                if element.find(NS + "ns").text != "0":
-                    element.clear()
-                    continue
-                title = element.find(NS + "title").text
-                content = element.find(NS + "revision").find(NS + "text").text
-                if "== {{langue|fr}} ==" not in content:
-                    element.clear()
-                    continue
-                clean_content = clear_article_content(content)
-                cursor.execute(
-                    """INSERT INTO entries (title, content) VALUES (?, ?)""",
-                    (title, clean_content))
-                element.clear()
-        pbar.close()
+    cursor.execute("BEGIN")
+    inserted = 0
+    if processes == 1:
+        pool_context, threads = contextlib.nullcontext(), None
+    else:
+        # The pool is forked before the decompression threads are started,
+        # and those are only given the CPUs left by the workers.
+        pool_context = multiprocessing.Pool(processes)
+        threads = max(1, os.cpu_count() - (processes or os.cpu_count()))
+    with pool_context as pool, open_dump(dump_filename, threads) as xml_file:
+        articles = iter_articles(xml_file, pool)
+        while True:
+            batch = list(itertools.islice(articles, INSERT_BATCH_SIZE))
+            if not batch:
+                break
+            cursor.executemany(INSERT_QUERY, batch)
+            inserted += len(batch)
+            if inserted % COMMIT_SIZE == 0:
+                cursor.execute("COMMIT")
+                cursor.execute("BEGIN")
+    # The number of entries is stored, for progress bars to avoid counting
+    # them with a full scan.
+    cursor.execute("""
+    INSERT OR REPLACE INTO meta (key, value)
+    VALUES ('row_count', (SELECT COUNT(*) FROM entries))
+    """.strip())
     logging.info("Commiting database insertions...")
-    connection.commit()
+    cursor.execute("COMMIT")
     connection.close()
 
 
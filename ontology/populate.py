@@ -4,8 +4,15 @@ should follow the schema precised in `download.py`.
 
 import os
 import gc
+import sys
+import queue
+import pathlib
 import logging
+import itertools
+import collections
+import threading
 import contextlib
+import multiprocessing
 import sqlite3
 import tqdm
 import owlready2
@@ -14,36 +21,178 @@ from article_parser import WikitextLiteral
 
 
 TQDM_BAR_FORMAT = "{desc}:\t{percentage:3.0f}%|{bar:10}{r_bar}"
+FETCH_SIZE = 10000
+PREFETCH_BATCHES = 8
+PREFETCH_TIMEOUT = .1
+DB_PRAGMAS = {
+    "query_only": 1,
+    "mmap_size": 30000000000,
+    "cache_size": -262144,
+    "temp_store": "MEMORY",
+}
+PARSE_BATCH_SIZE = 10000
+PARSE_CHUNK_SIZE = 200
+PARSE_BATCHES_SUBMITTED = 2
+INSERT_BATCH_SIZE = 100000
+OUTPUT_BUFFER_SIZE = 1 << 20
+# The quadstore file is generated from scratch, so durability does not matter
+# while it is populated.
+QUADSTORE_PRAGMAS = {
+    "synchronous": "OFF",
+    "journal_mode": "MEMORY",
+}
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+OWL_NAMED_INDIVIDUAL = "http://www.w3.org/2002/07/owl#NamedIndividual"
 
 
 @contextlib.contextmanager
 def get_db_cursor(database_filename):
     """Context function for read-only interaction with the database.
     """
-    connection = sqlite3.connect(database_filename)
-    cursor = connection.cursor()
-    yield cursor
-    connection.close()
+    uri = pathlib.Path(database_filename).absolute().as_uri() + "?mode=ro"
+    connection = sqlite3.connect(uri, uri=True)
+    try:
+        for pragma, value in DB_PRAGMAS.items():
+            connection.execute("PRAGMA %s = %s" % (pragma, value))
+        yield connection.cursor()
+    finally:
+        connection.close()
+
+
+def count_db_rows(cursor):
+    """Return the number of entries in the database, as stored in its meta
+    table, or by counting them if it has none (older databases).
+    """
+    try:
+        row = cursor.execute(
+            "SELECT value FROM meta WHERE key = 'row_count'").fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    if row is None:
+        row = cursor.execute("SELECT COUNT(*) FROM entries").fetchone()
+    return row[0]
+
+
+def _put_batch(batches, item, stop):
+    """Put an item in the `batches` queue, unless the `stop` event is set
+    while waiting for a free slot.
+    """
+    while not stop.is_set():
+        try:
+            batches.put(item, timeout=PREFETCH_TIMEOUT)
+            return
+        except queue.Full:
+            continue
+
+
+def _read_batches(database_filename, query, batches, stop):
+    """Producer thread for `iter_db_rows`: put the rows of the query result in
+    the `batches` queue, by chunks of `FETCH_SIZE` rows, then None. An error
+    is put in the queue instead if one occurs. Reading stops as soon as the
+    `stop` event is set by the consumer.
+    """
+    end = None
+    try:
+        with get_db_cursor(database_filename) as cursor:
+            cursor.arraysize = FETCH_SIZE
+            cursor.execute(query)
+            while not stop.is_set():
+                rows = cursor.fetchmany()
+                if not rows:
+                    break
+                _put_batch(batches, rows, stop)
+    except Exception as error:  # pylint: disable=W0703
+        end = error
+    finally:
+        _put_batch(batches, end, stop)
+
+
+def _iter_batches(batches):
+    while True:
+        rows = batches.get()
+        if rows is None:
+            return
+        if isinstance(rows, Exception):
+            raise rows
+        yield rows
 
 
 def iter_db_rows(database_filename, max_iters=None, desc=None):
-    """Iterate over the database rows.
+    """Iterate over the database rows. Rows are read ahead by a separate
+    thread, so that reading the database overlaps with processing the rows.
     """
-    with get_db_cursor(database_filename) as cursor:
-        if max_iters is None:
-            total = cursor.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
-            query = "SELECT title, content FROM entries"
-        else:
-            total = max_iters
-            query = "SELECT title, content FROM entries LIMIT %d" % max_iters
-        for row in tqdm.tqdm(cursor.execute(query), total=total, desc=desc,
-                             bar_format=TQDM_BAR_FORMAT):
-            yield row
+    if max_iters is None:
+        with get_db_cursor(database_filename) as cursor:
+            total = count_db_rows(cursor)
+        query = "SELECT title, content FROM entries"
+    else:
+        total = max_iters
+        query = "SELECT title, content FROM entries LIMIT %d" % max_iters
+    batches = queue.Queue(maxsize=PREFETCH_BATCHES)
+    stop = threading.Event()
+    threading.Thread(
+        target=_read_batches,
+        args=(database_filename, query, batches, stop),
+        daemon=True
+    ).start()
+    # The producer is stopped if the rows are not consumed until the end,
+    # either because the generator is closed or because an error occurred.
+    try:
+        # The progress bar is updated once per batch rather than once per row.
+        with tqdm.tqdm(total=total, desc=desc, bar_format=TQDM_BAR_FORMAT)\
+                as progress:
+            for rows in _iter_batches(batches):
+                yield from rows
+                progress.update(len(rows))
+    finally:
+        stop.set()
+
+
+_WORKER_RESOURCE_MANAGER = None
+
+
+def _init_parsing_worker(resmgr):
+    global _WORKER_RESOURCE_MANAGER  # pylint: disable=W0603
+    _WORKER_RESOURCE_MANAGER = resmgr
+
+
+def _parse_article(article):
+    return WikitextLiteral.from_article(_WORKER_RESOURCE_MANAGER, *article)
+
+
+def iter_literals(resmgr, database_filename, max_iters=None, processes=1):
+    """Iterate over the literals parsed from the database articles. Unless a
+    single process is required, articles are parsed by a pool of worker
+    processes (as many as CPUs if `processes` is None), and literals are
+    yielded in no particular order.
+    """
+    rows = iter_db_rows(database_filename, max_iters, "Parsing database")
+    if processes == 1:
+        for article in rows:
+            yield WikitextLiteral.from_article(resmgr, *article)
+        return
+    with multiprocessing.Pool(
+            processes, _init_parsing_worker, (resmgr,)) as pool:
+        # Rows are submitted by batches, as the pool would otherwise read the
+        # whole database ahead of the workers. The next batch is submitted
+        # before the results of the current one are consumed, so that workers
+        # do not wait for the slowest chunk of each batch.
+        submitted = collections.deque()
+        while True:
+            batch = list(itertools.islice(rows, PARSE_BATCH_SIZE))
+            if batch:
+                submitted.append(pool.imap_unordered(
+                    _parse_article, batch, chunksize=PARSE_CHUNK_SIZE))
+            elif not submitted:
+                break
+            if not batch or len(submitted) >= PARSE_BATCHES_SUBMITTED:
+                yield from submitted.popleft()
 
 
 class OntologyManager:
     """Interface between the interal Python representation of individuals and
-    the owlready2 reprensation.
+    the owlready2 reprensation. Rather than going through owlready2 entities,
+    triples are buffered and inserted in bulk into the ontology quadstore.
     """
 
     def __init__(self, folder):
@@ -51,63 +200,154 @@ class OntologyManager:
         self.world = None
         self.ontology = None
         self._functional = dict()
+        self._classes = dict()
+        self._iris = dict()
+        self._objs = list()
+        self._datas = list()
+        self._functional_values = dict()
+        self._links = list()
+        self._importer = None
 
-    def load(self):
-        """Load the ontology schema.
+    def load(self, backend_filename=None):
+        """Load the ontology schema. If a backend filename is given, the
+        quadstore is directly populated in this file (overwritten if it
+        exists), instead of being held in memory.
         """
         uri = "file://" + os.path.join(os.getcwd(), self.folder, "schema.owl")
-        self.world = owlready2.World()
+        if backend_filename is None:
+            self.world = owlready2.World()
+        else:
+            if os.path.isfile(backend_filename):
+                logging.info("Deleting previous DB file %s", backend_filename)
+                os.remove(backend_filename)
+            self.world = owlready2.World(filename=backend_filename)
+            self.world.graph.commit()
+            for pragma, value in QUADSTORE_PRAGMAS.items():
+                self.world.graph.db.execute("PRAGMA %s = %s" % (pragma, value))
         self.ontology = self.world.get_ontology(uri).load()
+        self._iris = {
+            entity.name: self.ontology.base_iri + entity.name
+            for entity in itertools.chain(
+                self.ontology.classes(),
+                self.ontology.individuals(),
+                self.ontology.properties())
+        }
+        # Functionality does not depend on the individuals, so it is resolved
+        # once for all for every property of the schema.
+        self._functional = {
+            ppty.name: (ppty.iri, ppty.is_functional_for(owlready2.Thing))
+            for ppty in self.ontology.properties()
+        }
+
+    def _iri(self, name):
+        # Full IRIs of known entities are built once, which also saves the
+        # quadstore importer from hashing a new string for each reference.
+        iri = self._iris.get(name)
+        if iri is None:
+            iri = self.ontology.base_iri + name
+        return iri
+
+    def _flush(self):
+        if self._importer is None:
+            self._importer = self.ontology.graph.import_triples_from_queue(
+                None, delete_existing_triples=False)
+        insert_objs, insert_datas, _, _ = self._importer
+        insert_objs(self._objs)
+        # A None datatype stands for plain strings (xsd:string).
+        insert_datas(self._datas)
+        self._objs = list()
+        self._datas = list()
+
+    def _add_triple(self, subj, ppty, obj, is_data):
+        if is_data:
+            self._datas.append((self._iri(subj), ppty, obj, None))
+        else:
+            self._objs.append((self._iri(subj), ppty, self._iri(obj)))
+        if len(self._objs) + len(self._datas) >= INSERT_BATCH_SIZE:
+            self._flush()
 
-    def _add_property(self, subj, ppty, obj):
+    def _add_property(self, subj, ppty, obj, is_data=False):
         functionality = self._functional.get(ppty)
         if functionality is None:
-            ppty_node = self.ontology[ppty]
-            if ppty_node is None:
-                logging.error("Could not find the node for property '%s'", ppty)
-                return
-            functionality = ppty_node.is_functional_for(obj)
-            self._functional[ppty] = functionality
-        if functionality:
-            setattr(subj, ppty, obj)
+            logging.error("Could not find the node for property '%s'", ppty)
+            return
+        ppty_iri, is_functional = functionality
+        if is_functional:
+            # Only the last value set for a functional property is kept.
+            self._functional_values[(subj, ppty_iri)] = (obj, is_data)
         else:
-            getattr(subj, ppty).append(obj)
+            self._add_triple(subj, ppty_iri, obj, is_data)
 
     def add_individual(self, individual):
         """Add an individual to the ontology.
         """
-        _ = self.ontology[individual.cls](individual.iri)
+        cls_iri = self._classes.get(individual.cls)
+        if cls_iri is None:
+            cls_iri = self._classes[individual.cls] =\
+                self.ontology[individual.cls].iri
+        iri = self._iris[individual.iri] =\
+            self.ontology.base_iri + individual.iri
+        self._objs.append((iri, RDF_TYPE, OWL_NAMED_INDIVIDUAL))
+        self._objs.append((iri, RDF_TYPE, cls_iri))
 
     def add_properties(self, individual):
-        """Add all properties of an individual to the ontology.
+        """Add all properties of an individual to the ontology. Object
+        properties are only kept as `(subject, property, object, target)`
+        tuples until the commit, as they may target individuals that are not
+        added yet. Links to individuals that are still unknown by then are
+        dropped.
         """
-        node = self.ontology[individual.iri]
         for ppty, value in individual.get_data_properties():
-            self._add_property(node, ppty, value)
+            self._add_property(individual.iri, ppty, value, is_data=True)
+        # Links are kept until the end, and mostly target the same few
+        # individuals and properties: their strings are interned, as the
+        # parsing processes would otherwise send a new copy for each link.
+        # Links without target (e.g. to a sense dropped as an inflection)
+        # would be dropped at the commit anyway.
         for ppty, value in individual.get_object_properties():
-            obj = self.ontology[value]
-            if obj is None:
+            if value is None:
                 continue
-            self._add_property(node, ppty, obj)
+            value = sys.intern(value)
+            self._links.append(
+                (individual.iri, sys.intern(ppty), value, value))
         for ppty, value in individual.get_reversed_object_properties():
-            subj = self.ontology[value]
-            if subj is None:
+            if value is None:
                 continue
-            self._add_property(subj, ppty, node)
+            value = sys.intern(value)
+            self._links.append(
+                (value, sys.intern(ppty), individual.iri, value))
+
+    def commit(self):
+        """Insert all the buffered triples into the ontology.
+        """
+        for subj, ppty, obj, target in self._links:
+            if target in self._iris:
+                self._add_property(subj, ppty, obj)
+        self._links = list()
+        for (subj, ppty_iri), (obj, is_data)\
+                in self._functional_values.items():
+            self._add_triple(subj, ppty_iri, obj, is_data)
+        self._functional_values = dict()
+        self._flush()
+        finish = self._importer[3]
+        finish()
+        self._importer = None
 
     def save(self, output_filename, save_as_owl=False):
-        """Save the ontology to the disk.
+        """Save the ontology to the disk. Unless it is saved in OWL format, the
+        ontology must have been loaded with the output file as backend.
         """
         logging.info("Clearing memory...")
         gc.collect()
-        if os.path.isfile(output_filename):
-            logging.info("Deleting previous DB file %s", output_filename)
-            os.remove(output_filename)
         logging.info("Saving world...")
         if save_as_owl:
-            self.ontology.save(file=output_filename, format="rdfxml")
+            if os.path.isfile(output_filename):
+                logging.info("Deleting previous file %s", output_filename)
+                os.remove(output_filename)
+            with open(output_filename, "wb", buffering=OUTPUT_BUFFER_SIZE)\
+                    as file:
+                self.ontology.save(file=file, format="rdfxml")
         else:
-            self.world.set_backend(filename=output_filename)
             self.world.save()
 
 
@@ -116,33 +356,29 @@ def populate_individuals(
         resource_folder,
         output_filename,
         max_iters=None,
-        save_as_owl=False):
+        save_as_owl=False,
+        processes=1):
     """Populate the ontology with individuals parsed from the database.
     """
     logging.info("Loading resources...")
     resmgr = ResourceManager(resource_folder)
     resmgr.load()
     ontmgr = OntologyManager(resource_folder)
-    ontmgr.load()
-    logging.info("Parsing the database...")
-    literals = list()
-    for article in iter_db_rows(database_filename, max_iters, "Parsing database"):
-        literals.append(WikitextLiteral.from_article(resmgr, *article))
-    logging.info("Creating individuals...")
-    for literal in tqdm.tqdm(literals, desc="Creating individuals", bar_format=TQDM_BAR_FORMAT):
+    ontmgr.load(None if save_as_owl else output_filename)
+    logging.info("Parsing the database and creating individuals...")
+    # Literals are dropped as soon as their individuals are added.
+    for literal in iter_literals(
+            resmgr, database_filename, max_iters, processes):
         ontmgr.add_individual(literal)
-        for entry in literal.entries:
-            ontmgr.add_individual(entry)
-            for sense in entry.senses:
-                ontmgr.add_individual(sense)
-    logging.info("Creating properties...")
-    for literal in tqdm.tqdm(literals, desc="Creating properties", bar_format=TQDM_BAR_FORMAT):
         ontmgr.add_properties(literal)
         for entry in literal.entries:
+            ontmgr.add_individual(entry)
             ontmgr.add_properties(entry)
             for sense in entry.senses:
+                ontmgr.add_individual(sense)
                 ontmgr.add_properties(sense)
-    del literals
+    logging.info("Inserting triples...")
+    ontmgr.commit()
     logging.info("Saving ontology to %s", os.path.realpath(output_filename))
     ontmgr.save(output_filename, save_as_owl)
     logging.info("Done populating the ontology!")
@@ -2,8 +2,9 @@
 """
 
 import os
+import csv
+import sys
 import logging
-import pandas
 
 
 class ResourceManager:
@@ -29,16 +30,19 @@ class ResourceManager:
         """
         path = os.path.join(self.folder, filename)
         logging.info("Loading templates from %s", path)
-        dataframe = pandas.read_csv(path)
         mapping = dict()
-        for _, row in dataframe.iterrows():
-            val = row[val_col].strip()
-            if remove_iri_prefix:
-                val = val.replace(iri_prefix, "")
-            for key in row[key_col].split(";"):
+        with open(path, "r", encoding="utf8", newline="") as file:
+            for row in csv.DictReader(file):
+                val = row[val_col].strip()
                 if remove_iri_prefix:
-                    key = key.replace(iri_prefix, "")
-                mapping[key.strip()] = val
+                    val = val.replace(iri_prefix, "")
+                val = sys.intern(val)
+                for key in row[key_col].split(";"):
+                    if remove_iri_prefix:
+                        key = key.replace(iri_prefix, "")
+                    # Keys are interned, as they are looked up with section
+                    # titles and template names, which are interned as well.
+                    mapping[sys.intern(key.strip())] = val
         return mapping
 
     def load(self):
@@ -0,0 +1,236 @@
+"""Tests for the WikiText parser. Parsed elements are compared with the ones
+of `wikitextparser`, that the parser replaces, when it is installed. Run from
+this directory with `python -m unittest test_wikitext_parser`.
+"""
+
+import unittest
+import wikitext_parser
+try:
+    import wikitextparser
+except ImportError:
+    wikitextparser = None
+
+
+ARTICLE_CHAT = """== {{langue|fr}} ==
+{{ébauche|fr}}
+=== {{S|étymologie}} ===
+: Du {{étyl|la|fr|mot=cattus}}.
+
+=== {{S|nom|fr}} ===
+{{fr-rég|ʃa}}
+'''chat''' {{pron|ʃa|fr}} {{m}}
+# {{zoologie|fr}} [[mammifère|Mammifère]] [[carnivore]] félin de taille moyenne.
+#* ''Le chat dort.'' {{source|{{w|Victor Hugo}}, ''[[w:Les Misérables|Les Misérables]]''}}
+# {{figuré|fr}} Personne rusée.
+
+==== {{S|synonymes}} ====
+* [[matou]]
+* [[minet#fr|minet]]
+
+==== {{S|traductions}} ====
+{{trad-début}}
+* {{T|en}} : {{trad+|en|cat}}
+{{trad-fin}}
+
+=== {{S|prononciation}} ===
+* {{pron|ʃa|fr}}
+
+== {{langue|en}} ==
+=== {{S|nom|en}} ===
+'''chat''' {{pron|tʃæt|en}}
+# [[bavardage|Bavardage]].
+"""
+
+ARTICLE_MANGEAIS = """== {{langue|fr}} ==
+=== {{S|verbe|fr|flexion}} ===
+{{fr-verbe-flexion|manger| ind.i.1s = oui |ind.i.2s=oui}}
+'''mangeais''' {{pron|mɑ̃.ʒɛ|fr}}
+# ''Première personne du singulier de l’imparfait de'' [[manger]].
+# ''Deuxième personne du singulier de l’imparfait de'' [[manger]].
+"""
+
+ARTICLE_COMMENTS = """== {{langue|fr}} ==
+<!-- {{ébauche|fr}} [[caché]]
+== {{langue|de}} ==
+-->
+=== {{S|nom|fr}} ===
+'''mot''' {{m}} <!-- {{f}} -->
+# Un [[exemple]] <nowiki>{{m}} [[non]]</nowiki> l'<nowiki/>[[oui]].
+#* <pre>
+=== {{S|verbe|fr}} ===
+{{pas un modèle}}
+</pre>
+# Fin. <!-- commentaire non fermé
+=== {{S|adjectif|fr}} ===
+"""
+
+ARTICLE_NESTED = """== {{langue|fr}} ==
+=== {{S|nom|fr}} ===
+'''x''' {{ m }} {{lien|{{y|z}}|fr|sens=a=b}} [[ chat ]] [[a#b|c]] [[d|e|f]]
+# {{fr-verbe-flexion|manger|imp=[[a|b]]|{{x|{{y}}|[[z]]}}}}
+# {{#if:a|{{m}}}} {{}} {{ }} {{a[b}} {{a\nb}} {{m\n}} [[a\nb]] [[]] [[ ]]
+# [[Fichier:x.jpg|vignette|[[dans]] texte]] [[a]]b [[a{b]] [[a<b]]
+"""
+
+ARTICLE_CRLF = ARTICLE_CHAT.replace("\n", "\r\n")
+
+ARTICLE_UNCLOSED = """== {{langue|fr}} ==
+=== {{S|nom|fr}} ===
+'''mot''' {{m}}
+# Définition {{lien|modèle|fr|
+=== {{S|verbe|fr}} ===
+# Titre dans un modèle non fermé.
+}}
+==== {{S|synonymes}} ====
+* [[lien|non fermé
+=== {{S|adjectif|fr}} ===
+]]
+=== {{S|adverbe|fr}} ===
+{{ébauche-déf|
+== {{langue|en}} ==
+"""
+
+
+def describe_template(template):
+    """Return a comparable description of a template.
+    """
+    names = [argument.name for argument in template.arguments]
+    return (
+        template.name,
+        [(name, template.get_arg(name).value) for name in names],
+        [template.has_arg(name) for name in ("1", "2", "fr", "sens")],
+    )
+
+
+def describe_wikitext(wikitext):
+    """Return a comparable description of the templates and the wikilinks
+    of a parsed text.
+    """
+    return (
+        [describe_template(template) for template in wikitext.templates],
+        [(wikilink.target, wikilink.text) for wikilink in wikitext.wikilinks],
+    )
+
+
+def describe_sections(wikitext):
+    """Return a comparable description of the sections of a parsed text.
+    """
+    description = list()
+    for level in (None, 2, 3, 4):
+        for include_subsections in (True, False):
+            for section in wikitext.get_sections(
+                    level=level, include_subsections=include_subsections):
+                if section.title is None:
+                    continue
+                description.append((
+                    level,
+                    include_subsections,
+                    section.title,
+                    section.contents,
+                    section.string,
+                    describe_wikitext(section),
+                ))
+    return description
+
+
+@unittest.skipIf(wikitextparser is None, "wikitextparser is not installed")
+class TestParity(unittest.TestCase):
+    """Compare parsed elements with the ones of `wikitextparser`.
+    """
+
+    def assert_same_parsing(self, string):
+        """Check that a string is parsed the same by both parsers.
+        """
+        expected = wikitextparser.parse(string)
+        actual = wikitext_parser.parse(string)
+        self.assertEqual(describe_sections(actual), describe_sections(expected))
+        self.assertEqual(describe_wikitext(actual), describe_wikitext(expected))
+
+    def test_article(self):
+        self.assert_same_parsing(ARTICLE_CHAT)
+
+    def test_inflection(self):
+        self.assert_same_parsing(ARTICLE_MANGEAIS)
+
+    def test_comments_nowiki_pre(self):
+        self.assert_same_parsing(ARTICLE_COMMENTS)
+
+    def test_nested_elements(self):
+        self.assert_same_parsing(ARTICLE_NESTED)
+
+    def test_crlf(self):
+        self.assert_same_parsing(ARTICLE_CRLF)
+
+    def test_unclosed_elements(self):
+        self.assert_same_parsing(ARTICLE_UNCLOSED)
+
+    def test_titles_within_arguments(self):
+        self.assert_same_parsing("{{m|a\n== b ==\n|c|d=e}}\n== f ==\n")
+        self.assert_same_parsing("{{m|a\n== b ==\n}}\n== f ==\n{{m|a\n=b}}")
+
+
+class TestParser(unittest.TestCase):
+    """Check the parsed elements of sample articles.
+    """
+
+    def test_sections(self):
+        parsed = wikitext_parser.parse(ARTICLE_CHAT)
+        self.assertEqual(
+            [section.title for section in parsed.get_sections(level=2)],
+            [" {{langue|fr}} ", " {{langue|en}} "])
+        section = parsed.get_sections(level=3)[1]
+        self.assertEqual(section.title, " {{S|nom|fr}} ")
+        self.assertEqual(
+            [subsection.title for subsection in section.get_sections()],
+            [" {{S|nom|fr}} ", " {{S|synonymes}} ", " {{S|traductions}} "])
+        self.assertEqual(section.head.string.count("\n"), 7)
+
+    def test_crlf(self):
+        parsed = wikitext_parser.parse(ARTICLE_CRLF)
+        self.assertEqual(len(parsed.get_sections(level=2)), 2)
+        self.assertEqual(len(parsed.get_sections(level=3)), 4)
+
+    def test_ignored_contents(self):
+        parsed = wikitext_parser.parse(ARTICLE_COMMENTS)
+        self.assertEqual(
+            [section.title for section in parsed.get_sections()],
+            [" {{langue|fr}} ", " {{S|nom|fr}} "])
+        self.assertEqual(
+            [template.name for template in parsed.templates],
+            ["langue", "S", "m"])
+        self.assertEqual(
+            [wikilink.target for wikilink in parsed.wikilinks],
+            ["exemple", "oui"])
+
+    def test_templates(self):
+        parsed = wikitext_parser.parse(ARTICLE_MANGEAIS)
+        template = parsed.templates[2]
+        self.assertEqual(template.name, "fr-verbe-flexion")
+        self.assertEqual(template.get_arg("1").value, "manger")
+        self.assertEqual(template.get_arg("ind.i.1s").value, " oui ")
+        self.assertTrue(template.has_arg("ind.i.2s"))
+        self.assertFalse(template.has_arg("2"))
+
+    def test_wikilinks(self):
+        parsed = wikitext_parser.parse(ARTICLE_NESTED)
+        wikilink = parsed.wikilinks[1]
+        self.assertEqual((wikilink.target, wikilink.text), ("a#b", "c"))
+        self.assertEqual(parsed.wikilinks[2].text, "e|f")
+
+    def test_unclosed_elements(self):
+        parsed = wikitext_parser.parse(ARTICLE_UNCLOSED)
+        self.assertEqual(
+            [section.title for section in parsed.get_sections(level=3)],
+            [" {{S|nom|fr}} ", " {{S|adverbe|fr}} "])
+        self.assertEqual(len(parsed.get_sections(level=2)), 2)
+
+    def test_balance(self):
+        string = "{{m|\n== a ==\n}} [[b\n== c ==\n"
+        self.assertTrue(wikitext_parser.is_balanced(string, 0, 0))
+        self.assertFalse(wikitext_parser.is_balanced(string, 0, 5))
+        self.assertTrue(wikitext_parser.is_balanced(string, 0, 16))
+        self.assertFalse(wikitext_parser.is_balanced(string, 0, len(string)))
+
+
+if __name__ == "__main__":
+    unittest.main()
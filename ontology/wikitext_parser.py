@@ -0,0 +1,435 @@
+"""Lightweight WikiText parser, restricted to what the article parser needs:
+sections, templates (with their arguments) and wikilinks. Its interface is a
+subset of the one of `wikitextparser`, whose full syntax tree is way too slow
+to build for the whole dump. Comments, <nowiki> and <pre> contents are ignored.
+As with `wikitextparser`, title lines within a template or a wikilink (such as
+one left open by mistake) are not headings. Template parameters, such as
+`{{{1|default}}}`, are not supported, as they do not occur in articles.
+"""
+
+import re
+import bisect
+import itertools
+
+
+HEADING_PATTERN = re.compile(r"^(={1,6})(.+)\1[^\S\n]*$", re.MULTILINE)
+SHADOW_PATTERN = re.compile(
+    r"<!--.*?(?:-->|$)|<nowiki\s*/>"
+    r"|<(nowiki|pre)(?:\s[^>]*)?(?<!/)>.*?</\1\s*>",
+    re.DOTALL | re.IGNORECASE)
+IGNORED_START_PATTERN = re.compile(r"<!--|<(?:nowiki|pre)", re.IGNORECASE)
+PAIR_TOKEN_PATTERN = re.compile(r"{{|}}|\[\[|\]\]")
+ARGUMENT_TOKEN_PATTERN = re.compile(r"{{|}}|\[\[|\]\]|\||=")
+TEMPLATE_NAME_PATTERN = re.compile(r"[^\[\]{}<>\n#][^\[\]{}<>\n]*")
+INVALID_TARGET_CHARACTERS = set("[]{}<>\n")
+
+
+def _blank(match):
+    return " " * len(match.group(0))
+
+
+def _split_arguments(shadow, start, end, wikilink_ends):
+    """Split a template inner span on the pipes that are not nested within
+    another template or a valid wikilink, whose end positions are mapped
+    from their start positions in `wikilink_ends`. Return a list of `(start, equals, end)`
+    tuples, where `equals` is the position of the first top level equal sign
+    of the part, or -1. As with `wikitextparser`, the equal signs of a title
+    line are not name-value separators: `equals` is -2 for parts that have
+    some, but no other.
+    """
+    parts = list()
+    part_start, equals, depth, heading_end = start, -1, 0, -1
+    wikilink_end = -1
+    for match in ARGUMENT_TOKEN_PATTERN.finditer(shadow, start, end):
+        token = match.group(0)
+        if match.start() < wikilink_end:
+            continue
+        if token == "{{":
+            depth += 1
+        elif token == "}}":
+            depth = max(0, depth - 1)
+        elif token == "[[":
+            wikilink_end = wikilink_ends.get(match.start(), -1)
+        elif token == "]]" or depth > 0:
+            continue
+        elif token == "|":
+            parts.append((part_start, equals, match.start()))
+            part_start, equals = match.end(), -1
+        elif equals < 0 and match.start() >= heading_end:
+            if shadow[match.start() - 1] == "\n":
+                heading = HEADING_PATTERN.match(shadow, match.start(), end)
+                if heading is not None and heading.end() < end:
+                    heading_end = heading.end()
+                    equals = -2
+                    continue
+            equals = match.start()
+    parts.append((part_start, equals, end))
+    return parts
+
+
+class _Document:
+    """Shared state of a parsed string: the string itself, its shadow (where
+    ignored contents are blanked) and the positions of its elements, lazily
+    computed.
+    """
+
+    __slots__ = (
+        "string",
+        "shadow",
+        "_headings",
+        "_heading_starts",
+        "_templates",
+        "_wikilinks",
+    )
+
+    def __init__(self, string):
+        self.string = string
+        self.shadow = SHADOW_PATTERN.sub(_blank, string)
+        self._headings = None
+        self._heading_starts = None
+        self._templates = None
+        self._wikilinks = None
+
+    @property
+    def headings(self):
+        """List of `(start, line_end, level, title, end, head_end)` tuples,
+        where `end` and `head_end` are the end positions of the section
+        respectively with and without its subsections.
+        """
+        if self._headings is None:
+            # As with `wikitextparser`, title lines within a template or a
+            # wikilink (usually left open by mistake) are not headings. Those
+            # are sorted by start position, so a title line is within one of
+            # them if the furthest end of the ones starting before it is after
+            # it.
+            bounds = list()
+            for elements in (self.templates, self.wikilinks):
+                bounds.append((
+                    [element[0] for element in elements],
+                    list(itertools.accumulate(
+                        [element[1] for element in elements], max))
+                ))
+            matches = list()
+            for match in HEADING_PATTERN.finditer(self.shadow):
+                for starts, ends in bounds:
+                    i = bisect.bisect_left(starts, match.start())
+                    if i > 0 and ends[i - 1] > match.start():
+                        break
+                else:
+                    matches.append(match)
+            # Sections end where a section of the same or a higher level
+            # starts: open sections are stacked until then, so that headings
+            # are only gone through once.
+            ends = [len(self.string)] * len(matches)
+            opened = list()
+            for i, match in enumerate(matches):
+                level = len(match.group(1))
+                while opened and opened[-1][1] >= level:
+                    ends[opened.pop()[0]] = match.start()
+                opened.append((i, level))
+            self._headings = list()
+            for i, match in enumerate(matches):
+                head_end = len(self.string)
+                if i + 1 < len(matches):
+                    head_end = matches[i + 1].start()
+                self._headings.append((
+                    match.start(),
+                    match.end(),
+                    len(match.group(1)),
+                    self.string[match.start(2):match.end(2)],
+                    ends[i],
+                    head_end
+                ))
+            self._heading_starts = [heading[0] for heading in self._headings]
+        return self._headings
+
+    def iter_headings(self, start, end):
+        """Iterate over the headings starting within a span.
+        """
+        headings = self.headings
+        first = bisect.bisect_left(self._heading_starts, start)
+        for heading in headings[first:]:
+            if heading[0] >= end:
+                break
+            yield heading
+
+    def _match_pairs(self):
+        braces, brackets = list(), list()
+        templates, wikilinks = list(), list()
+        for match in PAIR_TOKEN_PATTERN.finditer(self.shadow):
+            token = match.group(0)
+            if token == "{{":
+                braces.append(match.start())
+            elif token == "[[":
+                brackets.append(match.start())
+            elif token == "}}":
+                if braces:
+                    templates.append((braces.pop(), match.end()))
+            elif brackets:
+                wikilinks.append((brackets.pop(), match.end()))
+        self._wikilinks = list()
+        for start, end in sorted(wikilinks):
+            pipe = self.shadow.find("|", start + 2, end - 2)
+            target_end = end - 2 if pipe < 0 else pipe
+            if INVALID_TARGET_CHARACTERS.isdisjoint(
+                    self.shadow[start + 2:target_end]):
+                self._wikilinks.append((start, end, pipe))
+        wikilink_ends = {start: end for start, end, _ in self._wikilinks}
+        self._templates = list()
+        for start, end in sorted(templates):
+            parts = _split_arguments(
+                self.shadow, start + 2, end - 2, wikilink_ends)
+            name_start, _, name_end = parts[0]
+            if TEMPLATE_NAME_PATTERN.fullmatch(
+                    self.shadow[name_start:name_end].strip()):
+                self._templates.append((start, end, parts))
+
+    @property
+    def templates(self):
+        """List of `(start, end, parts)` tuples for valid templates, sorted by
+        start position.
+        """
+        if self._templates is None:
+            self._match_pairs()
+        return self._templates
+
+    @property
+    def wikilinks(self):
+        """List of `(start, end, pipe)` tuples for valid wikilinks, sorted by
+        start position.
+        """
+        if self._wikilinks is None:
+            self._match_pairs()
+        return self._wikilinks
+
+
+def _in_span(elements, start, end):
+    first = bisect.bisect_left(elements, (start,))
+    for element in elements[first:]:
+        if element[0] >= end:
+            break
+        if element[1] <= end:
+            yield element
+
+
+class WikiText:
+    """A span of a parsed string.
+    """
+
+    __slots__ = ("_document", "_start", "_end")
+
+    def __init__(self, document, start, end):
+        self._document = document
+        self._start = start
+        self._end = end
+
+    @property
+    def string(self):
+        """Raw text of the span.
+        """
+        return self._document.string[self._start:self._end]
+
+    def __str__(self):
+        return self.string
+
+    @property
+    def templates(self):
+        """Templates within the span, nested ones included.
+        """
+        return [
+            Template(self._document, start, end, parts)
+            for start, end, parts
+            in _in_span(self._document.templates, self._start, self._end)
+        ]
+
+    @property
+    def wikilinks(self):
+        """Wikilinks within the span, nested ones included.
+        """
+        return [
+            WikiLink(self._document, start, end, pipe)
+            for start, end, pipe
+            in _in_span(self._document.wikilinks, self._start, self._end)
+        ]
+
+    def get_sections(self, level=None, include_subsections=True):
+        """Sections whose title is within the span, possibly filtered by
+        level. If `include_subsections` is False, sections stop at the next
+        title, whatever its level.
+        """
+        sections = list()
+        for start, line_end, section_level, title, end, head_end\
+                in self._document.iter_headings(self._start, self._end):
+            if level is not None and section_level != level:
+                continue
+            sections.append(Section(
+                self._document,
+                start,
+                end if include_subsections else head_end,
+                section_level,
+                title,
+                line_end,
+                head_end
+            ))
+        return sections
+
+
+class Section(WikiText):
+    """A section, starting with its title line.
+    """
+
+    __slots__ = ("level", "title", "_line_end", "_head_end")
+
+    def __init__(self, document, start, end, level, title, line_end, head_end):  # pylint: disable=R0913
+        WikiText.__init__(self, document, start, end)
+        self.level = level
+        self.title = title
+        self._line_end = line_end
+        self._head_end = head_end
+
+    @property
+    def head(self):
+        """The section up to its first subsection, whatever its level.
+        """
+        return Section(
+            self._document,
+            self._start,
+            min(self._head_end, self._end),
+            self.level,
+            self.title,
+            self._line_end,
+            self._head_end
+        )
+
+    @property
+    def contents(self):
+        """Raw text below the section title.
+        """
+        return self._document.string[min(self._line_end + 1, self._end):self._end]
+
+
+class Argument:
+    """A template argument. Positional arguments are named after their
+    position, starting at "1".
+    """
+
+    __slots__ = ("name", "value", "positional")
+
+    def __init__(self, name, value, positional):
+        self.name = name
+        self.value = value
+        self.positional = positional
+
+
+class Template(WikiText):
+    """A template, such as `{{name|arg1|key=arg2}}`.
+    """
+
+    __slots__ = ("_parts", "_arguments")
+
+    def __init__(self, document, start, end, parts):
+        WikiText.__init__(self, document, start, end)
+        self._parts = parts
+        self._arguments = None
+
+    @property
+    def name(self):
+        """Raw template name (whitespaces are kept).
+        """
+        name_start, _, name_end = self._parts[0]
+        return self._document.string[name_start:name_end]
+
+    @property
+    def arguments(self):
+        """List of the template arguments.
+        """
+        if self._arguments is None:
+            string = self._document.string
+            self._arguments = list()
+            position = 0
+            for start, equals, end in self._parts[1:]:
+                if equals < 0:
+                    self._arguments.append(
+                        Argument(str(position + 1), string[start:end], True))
+                    # As with `wikitextparser`, positional arguments with a
+                    # title line are not counted in the following positions.
+                    if equals == -1:
+                        position += 1
+                else:
+                    self._arguments.append(Argument(
+                        string[start:equals], string[equals + 1:end], False))
+        return self._arguments
+
+    def get_arg(self, name):
+        """Return the last argument with the given name, or None.
+        """
+        name = name.strip()
+        for argument in reversed(self.arguments):
+            if argument.name.strip() == name:
+                return argument
+        return None
+
+    def has_arg(self, name):
+        """Check whether the template has an argument with the given name.
+        """
+        return self.get_arg(name) is not None
+
+
+class WikiLink(WikiText):
+    """A wikilink, such as `[[target|text]]`.
+    """
+
+    __slots__ = ("_pipe",)
+
+    def __init__(self, document, start, end, pipe):
+        WikiText.__init__(self, document, start, end)
+        self._pipe = pipe
+
+    @property
+    def target(self):
+        """Raw link target, with its fragment if any.
+        """
+        if self._pipe < 0:
+            return self._document.string[self._start + 2:self._end - 2]
+        return self._document.string[self._start + 2:self._pipe]
+
+    @property
+    def text(self):
+        """Raw link text, or None.
+        """
+        if self._pipe < 0:
+            return None
+        return self._document.string[self._pipe + 1:self._end - 2]
+
+
+def may_ignore(string, start, end):
+    """Check whether some contents within a span of a string may be ignored
+    by the parser (comments, <nowiki> and <pre> contents), or may hide the
+    contents that follow the span.
+    """
+    return IGNORED_START_PATTERN.search(string, start, end) is not None
+
+
+def is_balanced(string, start, end):
+    """Check whether all the templates and wikilinks opened within a span of
+    a string are closed within it, so that none of them crosses its end. If
+    the span starts at the beginning of the string, none of them crosses its
+    start either.
+    """
+    braces, brackets = 0, 0
+    for token in PAIR_TOKEN_PATTERN.findall(string, start, end):
+        if token == "{{":
+            braces += 1
+        elif token == "[[":
+            brackets += 1
+        elif token == "}}":
+            braces = max(0, braces - 1)
+        else:
+            brackets = max(0, brackets - 1)
+    return braces == 0 and brackets == 0
+
+
+def parse(string):
+    """Parse a WikiText string.
+    """
+    return WikiText(_Document(string), 0, len(string))
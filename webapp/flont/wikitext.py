@@ -6,11 +6,11 @@ from django.urls import reverse
 import wikitextparser
 from flont.languages import LANGUAGE_CODES
 
-NEW_LINES_PATTERN = re.compile("\n")
 REFERENCE_PATTERN = re.compile("<ref>(.*?)</ref>")
 WIKILINKS_PATTERN = re.compile(r"\[\[(.+?)(\#.*?)?(\|.+?)?\]\]")
 TEMPLATES_PATTERN = re.compile(r"{{.*?}}")
 SPACES_PATTERN = re.compile("(  +)")
+QUOTES_PATTERN = re.compile("''+")
 
 
 def format_word(raw, trs=None, sense=None):
@@ -49,7 +49,7 @@ def repl_wikilinks(match):
 def _external_link_template_hanlder(base_url):
     def fun(template):
         name = template.get_arg("1").value
-        url = re.sub(" ", "_", name)
+        url = name.replace(" ", "_")
         if template.has_arg("2"):
             name = template.get_arg("2").value
         return """<a class="external" href="%s%s">%s</a>"""\
@@ -353,6 +353,7 @@ class WikiTextString:
 
     def __init__(self, parsed):
         self.parsed = parsed
+        self._html = None
 
     @classmethod
     def from_text(cls, raw):
@@ -360,14 +361,20 @@ class WikiTextString:
         """
         parsed = None
         try:
-            parsed = wikitextparser.parse(re.sub("''+", "", raw.strip()))
+            parsed = wikitextparser.parse(QUOTES_PATTERN.sub("", raw.strip()))
         except TypeError:
             return None
         return cls(parsed)
 
     def html(self):
-        """Convert WikiText to HTML code.
+        """Convert WikiText to HTML code. The conversion is only done once,
+        as definitions are checked for emptiness before being rendered.
         """
+        if self._html is None:
+            self._html = self._convert()
+        return self._html
+
+    def _convert(self):
         repls = list()
         for template in self.parsed.templates:
             handler = TEMPLATE_HANDLERS.get(template.name)
@@ -389,7 +396,7 @@ class WikiTextString:
         for placeholder, repl in repls:
             string = string.replace(placeholder, repl)
         string = WIKILINKS_PATTERN.sub(repl_wikilinks, string)
-        string = NEW_LINES_PATTERN.sub("<br>", string)
+        string = string.replace("\n", "<br>")
         string = REFERENCE_PATTERN.sub("", string)
         string = TEMPLATES_PATTERN.sub("", string)
         string = SPACES_PATTERN.sub("", string)